@@ -313,43 +313,7 @@ impl FrameCapture {
 
     /// Upscale 960x1080 → 3840x2160 using bilinear interpolation
     fn upscale_grayscale(&mut self) {
-        let src_w = GROUPS_PER_ROW;
-        let src_h = HEIGHT / 2;
-        let dst_w = WIDTH;
-        let dst_h = HEIGHT;
-        
-        let x_ratio = ((src_w - 1) << 16) / (dst_w - 1);
-        let y_ratio = ((src_h - 1) << 16) / (dst_h - 1);
-        
-        for dst_y in 0..dst_h {
-            let src_y_fp = dst_y * y_ratio;
-            let src_y0 = src_y_fp >> 16;
-            let src_y1 = (src_y0 + 1).min(src_h - 1);
-            let y_frac = (src_y_fp & 0xFFFF) as u32;
-            
-            let dst_row = dst_y * dst_w;
-            
-            for dst_x in 0..dst_w {
-                let src_x_fp = dst_x * x_ratio;
-                let src_x0 = src_x_fp >> 16;
-                let src_x1 = (src_x0 + 1).min(src_w - 1);
-                let x_frac = (src_x_fp & 0xFFFF) as u32;
-                
-                let p00 = self.gray_native[src_y0 * src_w + src_x0] as u32;
-                let p01 = self.gray_native[src_y0 * src_w + src_x1] as u32;
-                let p10 = self.gray_native[src_y1 * src_w + src_x0] as u32;
-                let p11 = self.gray_native[src_y1 * src_w + src_x1] as u32;
-                
-                let x_inv = 0x10000 - x_frac;
-                let y_inv = 0x10000 - y_frac;
-                
-                let top = (p00 * x_inv + p01 * x_frac) >> 16;
-                let bot = (p10 * x_inv + p11 * x_frac) >> 16;
-                let val = (top * y_inv + bot * y_frac) >> 16;
-                
-                self.gray_output[dst_row + dst_x] = val as u8;
-            }
-        }
+        resize_bilinear(&self.gray_native, GROUPS_PER_ROW, HEIGHT / 2, &mut self.gray_output, WIDTH, HEIGHT);
     }
 
     // ==================== JPEG ENCODING ====================
@@ -413,6 +377,26 @@ impl FrameCapture {
         self.encode_jpeg()
     }
 
+    /// Output frame size (width, height)
+    pub fn frame_size(&self) -> (u16, u16) {
+        (WIDTH as u16, HEIGHT as u16)
+    }
+
+    /// Grayscale of the last capture resized to width x height, straight from
+    /// the native 960x1080 buffer (no 4K copy). Only available in grayscale
+    /// mode; lets the detector skip JPEG decode and resize
+    pub fn gray_frame(&self, width: u16, height: u16) -> Option<Vec<u8>> {
+        match self.config.mode {
+            CaptureMode::Grayscale => {
+                let (width, height) = (width as usize, height as usize);
+                let mut data = vec![0u8; width * height];
+                resize_bilinear(&self.gray_native, GROUPS_PER_ROW, HEIGHT / 2, &mut data, width, height);
+                Some(data)
+            }
+            CaptureMode::Color => None,
+        }
+    }
+
     #[allow(dead_code)]
     pub fn config(&self) -> &CaptureConfig {
         &self.config
@@ -425,3 +409,39 @@ impl Drop for FrameCapture {
         tracing::info!("Capture stopped");
     }
 }
+
+/// Fixed-point bilinear resize of an 8-bit src_w x src_h image into dst_w x dst_h
+fn resize_bilinear(src: &[u8], src_w: usize, src_h: usize, dst: &mut [u8], dst_w: usize, dst_h: usize) {
+    let x_ratio = ((src_w - 1) << 16) / (dst_w - 1);
+    let y_ratio = ((src_h - 1) << 16) / (dst_h - 1);
+    
+    for dst_y in 0..dst_h {
+        let src_y_fp = dst_y * y_ratio;
+        let src_y0 = src_y_fp >> 16;
+        let src_y1 = (src_y0 + 1).min(src_h - 1);
+        let y_frac = (src_y_fp & 0xFFFF) as u32;
+        
+        let dst_row = dst_y * dst_w;
+        
+        for dst_x in 0..dst_w {
+            let src_x_fp = dst_x * x_ratio;
+            let src_x0 = src_x_fp >> 16;
+            let src_x1 = (src_x0 + 1).min(src_w - 1);
+            let x_frac = (src_x_fp & 0xFFFF) as u32;
+            
+            let p00 = src[src_y0 * src_w + src_x0] as u32;
+            let p01 = src[src_y0 * src_w + src_x1] as u32;
+            let p10 = src[src_y1 * src_w + src_x0] as u32;
+            let p11 = src[src_y1 * src_w + src_x1] as u32;
+            
+            let x_inv = 0x10000 - x_frac;
+            let y_inv = 0x10000 - y_frac;
+            
+            let top = (p00 * x_inv + p01 * x_frac) >> 16;
+            let bot = (p10 * x_inv + p11 * x_frac) >> 16;
+            let val = (top * y_inv + bot * y_frac) >> 16;
+            
+            dst[dst_row + dst_x] = val as u8;
+        }
+    }
+}
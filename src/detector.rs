@@ -4,9 +4,9 @@
 
 use anyhow::{Context, Result};
 use serde::{Deserialize, Serialize};
-use std::io::{BufRead, BufReader, Write};
+use std::io::{BufRead, BufReader, ErrorKind, Read, Write};
 use std::process::{Command, Stdio};
-use std::sync::mpsc::{self, Receiver, Sender};
+use std::sync::mpsc::{self, Receiver, SyncSender, TrySendError};
 use std::sync::{Arc, Mutex};
 use std::thread;
 
@@ -48,15 +48,68 @@ impl Default for DetectionResult {
     }
 }
 
+/// Frame format tags understood by yolo_detector.py (FORMAT_* there)
+#[allow(dead_code)]
+#[derive(Debug, Clone, Copy, PartialEq)]
+#[repr(u8)]
+pub enum FrameFormat {
+    /// Encoded JPEG
+    Jpeg = 0,
+    /// RGB888 already letterboxed to the model input size: the frame resized to
+    /// letterbox_size() and centred on gray (114) padding, as in
+    /// letterbox_params() in yolo_detector.py; width/height are the source frame
+    Rgb = 1,
+    /// Raw NV12
+    Nv12 = 2,
+    /// Raw 8-bit grayscale
+    Gray = 3,
+    /// 8-bit grayscale already resized to letterbox_size() of the frame
+    GrayResized = 4,
+}
+
+/// Model input size of yolo_detector.py (INPUT_SIZE there)
+const MODEL_INPUT_SIZE: f64 = 640.0;
+
+/// Frames queued for the detector thread - older ones are dropped rather
+/// than buffered when the detector falls behind
+const DETECT_QUEUE_DEPTH: usize = 2;
+
+/// Size a width x height frame is resized to inside the letterboxed model
+/// input, as in letterbox_params() in yolo_detector.py (even sizes)
+pub fn letterbox_size(width: u16, height: u16) -> (u16, u16) {
+    let r = (MODEL_INPUT_SIZE / width as f64).min(MODEL_INPUT_SIZE / height as f64);
+    let fit = |v: u16| ((((v as f64) * r).round_ties_even() as u16) & !1).max(2);
+    (fit(width), fit(height))
+}
+
+/// Frame header: u32 length, u8 format, u16 width, u16 height (little-endian)
+fn frame_header(len: u32, format: FrameFormat, width: u16, height: u16) -> [u8; 9] {
+    let mut header = [0u8; 9];
+    header[0..4].copy_from_slice(&len.to_le_bytes());
+    header[4] = format as u8;
+    header[5..7].copy_from_slice(&width.to_le_bytes());
+    header[7..9].copy_from_slice(&height.to_le_bytes());
+    header
+}
+
+/// Size of one detection record from yolo_detector.py (DETECTION_DTYPE there):
+/// u16 class id, f32 confidence, 4x i16 box (little-endian)
+const DETECTION_RECORD_SIZE: usize = 14;
+
 /// Request to detector thread
 enum DetectorRequest {
-    Detect(Vec<u8>),
+    Detect {
+        data: Vec<u8>,
+        format: FrameFormat,
+        width: u16,
+        height: u16,
+    },
     Shutdown,
 }
 
 /// YOLO Detector interface (thread-safe)
 pub struct YoloDetector {
-    request_tx: Sender<DetectorRequest>,
+    request_tx: SyncSender<DetectorRequest>,
     last_result: Arc<Mutex<DetectionResult>>,
     _handle: thread::JoinHandle<()>,
 }
@@ -68,7 +121,7 @@ unsafe impl Sync for YoloDetector {}
 impl YoloDetector {
     /// Create and start the detector
     pub fn new() -> Result<Self> {
-        let (request_tx, request_rx) = mpsc::channel::<DetectorRequest>();
+        let (request_tx, request_rx) = mpsc::sync_channel::<DetectorRequest>(DETECT_QUEUE_DEPTH);
         let last_result = Arc::new(Mutex::new(DetectionResult::default()));
         let result_clone = last_result.clone();
 
@@ -86,12 +139,23 @@ impl YoloDetector {
         })
     }
 
-    /// Submit frame for detection (non-blocking)
+    /// Submit JPEG frame for detection (non-blocking)
     pub fn detect(&self, jpeg_data: Vec<u8>) -> Result<()> {
-        self.request_tx
-            .send(DetectorRequest::Detect(jpeg_data))
-            .context("Failed to send detection request")?;
-        Ok(())
+        self.detect_frame(jpeg_data, FrameFormat::Jpeg, 0, 0)
+    }
+
+    /// Submit frame in any supported format for detection (non-blocking)
+    /// Width/height are the frame dimensions (unused for JPEG)
+    /// The frame is dropped if the detector already has DETECT_QUEUE_DEPTH queued
+    pub fn detect_frame(&self, data: Vec<u8>, format: FrameFormat, width: u16, height: u16) -> Result<()> {
+        match self.request_tx.try_send(DetectorRequest::Detect { data, format, width, height }) {
+            Ok(()) => Ok(()),
+            Err(TrySendError::Full(_)) => {
+                tracing::debug!("Detector busy, dropping frame");
+                Ok(())
+            }
+            Err(TrySendError::Disconnected(_)) => anyhow::bail!("Failed to send detection request"),
+        }
     }
 
     /// Get latest detection result (non-blocking)
@@ -102,7 +166,8 @@ impl YoloDetector {
 
 impl Drop for YoloDetector {
     fn drop(&mut self) {
-        let _ = self.request_tx.send(DetectorRequest::Shutdown);
+        // A full queue is fine - dropping the sender closes the channel anyway
+        let _ = self.request_tx.try_send(DetectorRequest::Shutdown);
     }
 }
 
@@ -132,19 +197,41 @@ fn detector_thread(
     if !ready_line.trim().eq("READY") {
         anyhow::bail!("Detector did not signal READY: {}", ready_line);
     }
-    tracing::info!("YOLO detector ready!");
+    let labels = read_labels(&mut reader).context("Failed to read detector labels")?;
+    tracing::info!("YOLO detector ready! ({} classes)", labels.len());
+
+    // Read responses on their own thread so the next frame can be written
+    // while the detector is still working on the previous one
+    let reader_result = last_result.clone();
+    let reader_handle = thread::spawn(move || loop {
+        match read_response(&mut reader, &labels) {
+            Ok(result) => {
+                if let Ok(mut guard) = reader_result.lock() {
+                    *guard = result;
+                }
+            }
+            Err(e) if e.kind() == ErrorKind::UnexpectedEof => {
+                tracing::info!("Detector output closed");
+                break;
+            }
+            Err(e) => {
+                tracing::error!("Failed to read detector response: {}", e);
+                break;
+            }
+        }
+    });
 
     // Process requests
     for request in request_rx {
         match request {
-            DetectorRequest::Detect(jpeg_data) => {
-                // Send length prefix + data
-                let len = jpeg_data.len() as u32;
-                if stdin.write_all(&len.to_le_bytes()).is_err() {
-                    tracing::error!("Failed to write length to detector");
+            DetectorRequest::Detect { data, format, width, height } => {
+                // Send frame header + data
+                let header = frame_header(data.len() as u32, format, width, height);
+                if stdin.write_all(&header).is_err() {
+                    tracing::error!("Failed to write header to detector");
                     break;
                 }
-                if stdin.write_all(&jpeg_data).is_err() {
+                if stdin.write_all(&data).is_err() {
                     tracing::error!("Failed to write data to detector");
                     break;
                 }
@@ -152,31 +239,6 @@ fn detector_thread(
                     tracing::error!("Failed to flush detector stdin");
                     break;
                 }
-
-                // Read JSON response
-                let mut response_line = String::new();
-                if reader.read_line(&mut response_line).is_err() {
-                    tracing::error!("Failed to read detector response");
-                    break;
-                }
-
-                // Parse JSON and update shared result
-                match serde_json::from_str::<DetectionResult>(&response_line) {
-                    Ok(result) => {
-                        if let Ok(mut guard) = last_result.lock() {
-                            *guard = result;
-                        }
-                    }
-                    Err(e) => {
-                        tracing::warn!("Failed to parse detection result: {}", e);
-                        if let Ok(mut guard) = last_result.lock() {
-                            *guard = DetectionResult {
-                                error: Some(format!("Parse error: {}", e)),
-                                ..Default::default()
-                            };
-                        }
-                    }
-                }
             }
             DetectorRequest::Shutdown => {
                 tracing::info!("Detector shutdown requested");
@@ -186,13 +248,75 @@ fn detector_thread(
     }
 
     // Cleanup
+    drop(stdin);
     let _ = child.kill();
     let _ = child.wait();
+    let _ = reader_handle.join();
     tracing::info!("YOLO detector stopped");
 
     Ok(())
 }
 
+/// Read the class labels sent once after READY: u32 length + newline-joined UTF-8
+fn read_labels<R: Read>(reader: &mut R) -> std::io::Result<Vec<String>> {
+    let mut len = [0u8; 4];
+    reader.read_exact(&mut len)?;
+    let mut data = vec![0u8; u32::from_le_bytes(len) as usize];
+    reader.read_exact(&mut data)?;
+    Ok(String::from_utf8_lossy(&data).lines().map(str::to_owned).collect())
+}
+
+/// Read one binary response: u16 width, u16 height, u32 count (little-endian),
+/// then count detection records. Width = height = 0 marks an error, in which
+/// case count is the length of the UTF-8 message that follows
+fn read_response<R: Read>(reader: &mut R, labels: &[String]) -> std::io::Result<DetectionResult> {
+    let mut header = [0u8; 8];
+    reader.read_exact(&mut header)?;
+    let width = u16::from_le_bytes([header[0], header[1]]);
+    let height = u16::from_le_bytes([header[2], header[3]]);
+    let count = u32::from_le_bytes([header[4], header[5], header[6], header[7]]) as usize;
+
+    if width == 0 && height == 0 {
+        let mut message = vec![0u8; count];
+        reader.read_exact(&mut message)?;
+        return Ok(DetectionResult {
+            error: Some(String::from_utf8_lossy(&message).into_owned()),
+            ..Default::default()
+        });
+    }
+
+    let mut payload = vec![0u8; count * DETECTION_RECORD_SIZE];
+    reader.read_exact(&mut payload)?;
+    let detections = payload
+        .chunks_exact(DETECTION_RECORD_SIZE)
+        .map(|r| {
+            let class_id = u16::from_le_bytes([r[0], r[1]]) as usize;
+            let coord = |i: usize| i16::from_le_bytes([r[i], r[i + 1]]) as i32;
+            Detection {
+                class: labels
+                    .get(class_id)
+                    .cloned()
+                    .unwrap_or_else(|| format!("class_{}", class_id)),
+                // Three decimals, as the JSON protocol reported it
+                confidence: (f32::from_le_bytes([r[2], r[3], r[4], r[5]]) * 1000.0).round() / 1000.0,
+                bbox: BBox {
+                    x1: coord(6),
+                    y1: coord(8),
+                    x2: coord(10),
+                    y2: coord(12),
+                },
+            }
+        })
+        .collect();
+
+    Ok(DetectionResult {
+        width: Some(width as u32),
+        height: Some(height as u32),
+        detections,
+        error: None,
+    })
+}
+
 /// Draw detection boxes on an image (modifies JPEG in-place would require re-encoding)
 /// Returns a new JPEG with boxes drawn
 pub fn draw_detections(jpeg_data: &[u8], detections: &[Detection]) -> Result<Vec<u8>> {
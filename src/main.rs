@@ -19,7 +19,7 @@ use axum::{
 };
 use bytes::Bytes;
 use capture::{CaptureMode, FrameCapture};
-use detector::{DetectionResult, YoloDetector};
+use detector::{letterbox_size, DetectionResult, FrameFormat, YoloDetector};
 use parking_lot::RwLock;
 use std::{sync::Arc, time::Duration};
 use tokio::time::interval;
@@ -140,12 +140,22 @@ async fn capture_loop(state: SharedState) {
                     detection_frame_counter += 1;
                     
                     if detection_frame_counter % 3 == 0 {
-                        // Send frame to detector
+                        // Send frame to detector - grayscale already resized to the model
+                        // input when available (no JPEG decode or resize)
                         if let Some(ref detector) = *state.detector.read() {
+                            let gray_frame = state.capture.read().as_ref().and_then(|c| {
+                                let (width, height) = c.frame_size();
+                                let (fit_w, fit_h) = letterbox_size(width, height);
+                                c.gray_frame(fit_w, fit_h).map(|data| (data, width, height))
+                            });
+                            let frame_bytes = gray_frame.as_ref().map_or(jpeg_data.len(), |(data, _, _)| data.len());
                             if detection_frame_counter % 30 == 0 {
-                                tracing::info!("Sending frame {} to detector ({} bytes)", detection_frame_counter, jpeg_data.len());
+                                tracing::info!("Sending frame {} to detector ({} bytes)", detection_frame_counter, frame_bytes);
                             }
-                            let _ = detector.detect(jpeg_data.clone());
+                            let _ = match gray_frame {
+                                Some((data, width, height)) => detector.detect_frame(data, FrameFormat::GrayResized, width, height),
+                                None => detector.detect(jpeg_data.clone()),
+                            };
                         }
                     }
                     
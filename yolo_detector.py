@@ -4,13 +4,16 @@ YOLO Object Detection Service for IMX415 Streamer
 Uses RKNN-Lite to run YOLOv5s on Rock 5C NPU
 
 Runs as a subprocess, communicates via stdin/stdout:
-- Input: Raw grayscale JPEG data (length prefix)
-- Output: JSON detection results
+- Input: JPEG, pre-resized RGB/grayscale or raw NV12/grayscale frames (length + format header)
+- Output: length-prefixed binary detection records
 """
 
+import functools
+import os
 import sys
 import struct
-import json
+import queue
+import threading
 import numpy as np
 import cv2
 from io import BytesIO
@@ -22,12 +25,22 @@ except ImportError:
     print("ERROR: rknnlite not installed", file=sys.stderr)
     sys.exit(1)
 
+# Numba is optional - without it the vectorized NumPy decode is used
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 # Model configuration
 MODEL_PATH = "/home/angelo/imx415_streamer/models/yolov5s-640-640.rknn"
 LABELS_PATH = "/home/angelo/imx415_streamer/models/coco_80_labels_list.txt"
 INPUT_SIZE = 640
 CONF_THRESHOLD = 0.25
 NMS_THRESHOLD = 0.45
+NMS_TOP_K = 300  # Highest-scoring candidates considered by NMS
+
+# Per-frame tensor stats on stderr (scans every output tensor - keep off in production)
+DEBUG = os.environ.get("YOLO_DEBUG", "0") not in ("", "0")
 
 # YOLOv5 anchors for 640x640
 ANCHORS = [
@@ -37,6 +50,76 @@ ANCHORS = [
 ]
 STRIDES = [8, 16, 32]
 
+# Letterbox padding value (YOLOv5 default gray)
+PAD_VALUE = 114
+
+# Input frame header: length, format tag, source width, source height (little-endian)
+FRAME_HEADER = struct.Struct('<IBHH')
+FORMAT_JPEG = 0  # Encoded JPEG (width/height unused)
+FORMAT_RGB = 1   # RGB888 already letterboxed to INPUT_SIZE x INPUT_SIZE (see letterbox_params), width/height = source frame
+FORMAT_NV12 = 2  # Raw NV12 at width x height (e.g. straight from the ISP)
+FORMAT_GRAY = 3  # Raw 8-bit grayscale at width x height
+FORMAT_GRAY_RESIZED = 4  # 8-bit grayscale already resized to letterbox_params' new_w x new_h (no padding), width/height = source frame
+
+# Initial receive buffer - fits a raw 4K grayscale frame, grown on demand
+FRAME_BUFFER_SIZE = 3840 * 2160
+
+# Frames in flight: one being preprocessed while the other is on the NPU
+PIPELINE_DEPTH = 2
+
+# Result header: source width, source height, detection count (little-endian).
+# Width = height = 0 marks an error, the count is then the UTF-8 message length
+RESULT_HEADER = struct.Struct('<HHI')
+
+# One detection on the wire: class id, confidence, clipped box in source pixels
+DETECTION_DTYPE = np.dtype([
+    ('c', '<u2'), ('s', '<f4'),
+    ('x1', '<i2'), ('y1', '<i2'), ('x2', '<i2'), ('y2', '<i2'),
+])
+
+
+def letterbox_params(img_w, img_h):
+    """
+    Aspect-preserving fit of an img_w x img_h frame into the model input
+    Returns (new_w, new_h, pad_x, pad_y): the resized frame size and its offset
+    """
+    r = min(INPUT_SIZE / img_w, INPUT_SIZE / img_h)
+    
+    # Even sizes keep NV12 chroma planes whole
+    new_w = max(2, int(round(img_w * r)) & ~1)
+    new_h = max(2, int(round(img_h * r)) & ~1)
+    
+    return new_w, new_h, (INPUT_SIZE - new_w) // 2, (INPUT_SIZE - new_h) // 2
+
+
+@functools.lru_cache(maxsize=8)
+def box_transform(img_w, img_h):
+    """
+    (scale, offset) mapping model-input boxes to the original frame as one
+    broadcast multiply-add: undoes the letterbox padding and resize
+    """
+    new_w, new_h, pad_x, pad_y = letterbox_params(img_w, img_h)
+    scale = np.array([img_w / new_w, img_h / new_h] * 2, dtype=np.float32)
+    offset = -np.array([pad_x, pad_y] * 2, dtype=np.float32) * scale
+    return scale, offset
+
+
+def build_levels():
+    """
+    Per-level decode constants, float32 so the decode stays in single precision
+    Returns a list of (stride, anchor_wh (3, 2), grid_x (W,), grid_y (H,))
+    """
+    levels = []
+    for stride, anchor in zip(STRIDES, ANCHORS):
+        grid_size = INPUT_SIZE // stride
+        levels.append((
+            np.float32(stride),
+            np.asarray(anchor, dtype=np.float32),
+            np.arange(grid_size, dtype=np.float32),
+            np.arange(grid_size, dtype=np.float32),
+        ))
+    return levels
+
 
 def load_labels(path):
     """Load COCO class labels"""
@@ -48,24 +131,206 @@ def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
 
-def process_yolo_output(outputs, img_w, img_h):
+def logit(p):
+    """Inverse of sigmoid - maps a probability threshold into logit space"""
+    return np.log(p / (1 - p))
+
+
+def outputs_are_logits(outputs):
+    """
+    Check whether the model exports raw logits rather than sigmoid outputs
+    Only objectness/class channels are inspected - box channels may be decoded pixels
+    """
+    output = np.asarray(outputs[0])
+    batch, channels, grid_h, grid_w = output.shape
+    conf = output.reshape(3, channels // 3, grid_h, grid_w)[:, 4:]
+    return bool(conf.min() < -0.1 or conf.max() > 1.1)
+
+
+def boxes_are_grid_relative(output, logits=False):
+    """
+    Whether one level's (3, 85, H, W) box channels are grid-relative YOLOv5
+    offsets that still need decoding, rather than pixels decoded by the export
+    Decided once per level so every decode backend treats the level the same
+    """
+    if logits:
+        # Box channels go through sigmoid, so they always land in (0, 1)
+        return True
+    return bool(output[:, :2].max() < 10)
+
+
+def _decode_level_numpy(output, level, conf_thr, out, start, logits=False, grid_relative=True):
+    """
+    Decode one output level (3, 85, H, W) with NumPy
+    level: (stride, anchor_wh, grid_x, grid_y) from build_levels()
+    grid_relative: apply the YOLOv5 box decode (see boxes_are_grid_relative)
+    Writes boxes (x1, y1, x2, y2) in model input pixels, scores and class ids
+    into the out buffers from start, returns the new write cursor
+    """
+    stride, anchors, grid_x, grid_y = level
+    
+    # Transpose view to (3, H, W, 85)
+    output = output.transpose(0, 2, 3, 1)
+    
+    # Object confidence - filter whole grid at once. For logit outputs compare
+    # against the threshold in logit space so sigmoid only runs on survivors
+    obj_thr = logit(conf_thr) if logits else conf_thr
+    a_idx, gy, gx = np.nonzero(output[..., 4] >= obj_thr)
+    
+    # Gather surviving cells: (K, 85)
+    pred = output[a_idx, gy, gx]
+    if logits:
+        pred = sigmoid(pred)
+    
+    # Class probabilities
+    class_probs = pred[:, 5:]
+    class_id = class_probs.argmax(axis=1)
+    class_conf = class_probs[np.arange(len(pred)), class_id]
+    
+    # Final confidence
+    confidence = pred[:, 4] * class_conf
+    keep = confidence >= conf_thr
+    
+    pred = pred[keep]
+    a_idx, gy, gx = a_idx[keep], gy[keep], gx[keep]
+    
+    # Bounding box - YOLOv5 outputs are already decoded in some RKNN exports
+    bx, by, bw, bh = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+    if grid_relative:
+        bx = (bx * 2 - 0.5 + grid_x[gx]) * stride
+        by = (by * 2 - 0.5 + grid_y[gy]) * stride
+        bw = (bw * 2) ** 2 * anchors[a_idx, 0]
+        bh = (bh * 2) ** 2 * anchors[a_idx, 1]
+    
+    # Convert to corner format at the write cursor
+    boxes, scores, class_ids = out
+    end = start + len(pred)
+    boxes[start:end, 0] = bx - bw / 2
+    boxes[start:end, 1] = by - bh / 2
+    boxes[start:end, 2] = bx + bw / 2
+    boxes[start:end, 3] = by + bh / 2
+    scores[start:end] = confidence[keep]
+    class_ids[start:end] = class_id[keep]
+    
+    return end
+
+
+if njit is not None:
+    @njit(cache=True, parallel=True, fastmath=True)
+    def _decode_level_kernel(output, stride, anchors, conf_thr, obj_thr, logits, grid_relative,
+                             boxes, scores, class_ids, start):
+        """
+        Per-cell decode of one output level (3, 85, H, W), parallel over cells
+        obj_thr is conf_thr in the output's own space (logit space if logits)
+        grid_relative is the per-level flag from boxes_are_grid_relative
+        Cell i is written to row start + i of the candidate buffers (which hold
+        every cell of every level), then survivors are compacted down to start
+        Returns the new write cursor
+        """
+        num_anchors, num_outputs, grid_h, grid_w = output.shape
+        cells = grid_h * grid_w
+        n = num_anchors * cells
+        
+        for i in prange(n):
+            a = i // cells
+            gy = (i % cells) // grid_w
+            gx = i % grid_w
+            
+            # Negative score marks a rejected cell for the compaction pass
+            scores[start + i] = -1
+            
+            obj_conf = output[a, 4, gy, gx]
+            if obj_conf < obj_thr:
+                continue
+            
+            class_id = 0
+            class_conf = output[a, 5, gy, gx]
+            for c in range(1, num_outputs - 5):
+                if output[a, 5 + c, gy, gx] > class_conf:
+                    class_conf = output[a, 5 + c, gy, gx]
+                    class_id = c
+            
+            # Argmax is the same on logits, so only the winners need sigmoid
+            if logits:
+                obj_conf = 1 / (1 + np.exp(-obj_conf))
+                class_conf = 1 / (1 + np.exp(-class_conf))
+            
+            confidence = obj_conf * class_conf
+            if confidence < conf_thr:
+                continue
+            
+            bx = output[a, 0, gy, gx]
+            by = output[a, 1, gy, gx]
+            bw = output[a, 2, gy, gx]
+            bh = output[a, 3, gy, gx]
+            if logits:
+                bx = 1 / (1 + np.exp(-bx))
+                by = 1 / (1 + np.exp(-by))
+                bw = 1 / (1 + np.exp(-bw))
+                bh = 1 / (1 + np.exp(-bh))
+            
+            if grid_relative:
+                bx = (bx * 2 - 0.5 + gx) * stride
+                by = (by * 2 - 0.5 + gy) * stride
+                bw = (bw * 2) ** 2 * anchors[a, 0]
+                bh = (bh * 2) ** 2 * anchors[a, 1]
+            
+            row = start + i
+            boxes[row, 0] = bx - bw / 2
+            boxes[row, 1] = by - bh / 2
+            boxes[row, 2] = bx + bw / 2
+            boxes[row, 3] = by + bh / 2
+            scores[row] = confidence
+            class_ids[row] = class_id
+        
+        # Serial compaction - survivors are few, order is preserved
+        end = start
+        for row in range(start, start + n):
+            if scores[row] < 0:
+                continue
+            if row != end:
+                boxes[end, :] = boxes[row, :]
+                scores[end] = scores[row]
+                class_ids[end] = class_ids[row]
+            end += 1
+        
+        return end
+    
+    def _decode_level_numba(output, level, conf_thr, out, start, logits=False, grid_relative=True):
+        """Decode one output level with the JIT kernel, same contract as the NumPy path"""
+        stride, anchors = level[:2]
+        obj_thr = logit(conf_thr) if logits else conf_thr
+        boxes, scores, class_ids = out
+        return _decode_level_kernel(
+            output.astype(np.float32, copy=False), stride, anchors,
+            np.float32(conf_thr), np.float32(obj_thr), logits, grid_relative,
+            boxes, scores, class_ids, start)
+    
+    _decode_level = _decode_level_numba
+else:
+    _decode_level = _decode_level_numpy
+
+
+def process_yolo_output(outputs, img_w, img_h, levels, out=None, logits=False):
     """
     Process YOLOv5 RKNN output to bounding boxes
     Output format: (1, 255, H, W) where 255 = 3 anchors * 85 (4 + 1 + 80)
+    levels: per-level decode constants from build_levels()
+    logits: model outputs are raw logits (sigmoid applied to survivors only)
+    out: optional preallocated (boxes, scores, class_ids) buffers with a row
+    for every cell of every level; the returned arrays are then views into them
     """
-    boxes = []
-    scores = []
-    class_ids = []
-    
-    # Scale factors from input to original image
-    scale_x = img_w / INPUT_SIZE
-    scale_y = img_h / INPUT_SIZE
+    if out is None:
+        max_candidates = sum(3 * np.asarray(o).shape[2] * np.asarray(o).shape[3] for o in outputs)
+        out = (np.empty((max_candidates, 4), dtype=np.float32),
+               np.empty(max_candidates, dtype=np.float32),
+               np.empty(max_candidates, dtype=np.int64))
+    boxes, scores, class_ids = out
+    count = 0
     
     for idx, output in enumerate(outputs):
-        stride = STRIDES[idx]
-        anchor = ANCHORS[idx]
-        
-        output = np.array(output)
+        # No-op for the ndarrays RKNN returns; only copies if not C-contiguous
+        output = np.ascontiguousarray(output)
         
         # Output shape: (1, 255, H, W) - NCHW format
         # 255 = 3 anchors * 85 (x, y, w, h, obj_conf, 80 class scores)
@@ -73,66 +338,25 @@ def process_yolo_output(outputs, img_w, img_h):
         num_anchors = 3
         num_outputs = channels // num_anchors  # 85
         
-        # Reshape to (1, 3, 85, H, W) then transpose to (1, 3, H, W, 85)
-        output = output.reshape(batch, num_anchors, num_outputs, grid_h, grid_w)
-        output = output.transpose(0, 1, 3, 4, 2)  # (1, 3, H, W, 85)
-        
-        for a in range(num_anchors):
-            for gy in range(grid_h):
-                for gx in range(grid_w):
-                    pred = output[0, a, gy, gx]
-                    
-                    # Object confidence (already sigmoid from model or need sigmoid)
-                    obj_conf = pred[4]
-                    if obj_conf < CONF_THRESHOLD:
-                        continue
-                    
-                    # Class probabilities
-                    class_probs = pred[5:]
-                    class_id = np.argmax(class_probs)
-                    class_conf = class_probs[class_id]
-                    
-                    # Final confidence
-                    confidence = obj_conf * class_conf
-                    if confidence < CONF_THRESHOLD:
-                        continue
-                    
-                    # Bounding box - YOLOv5 outputs are already decoded in some RKNN exports
-                    # Check if values are in 0-1 range (normalized) or grid-relative
-                    bx = pred[0]
-                    by = pred[1]
-                    bw = pred[2]
-                    bh = pred[3]
-                    
-                    # If values seem to be grid-relative (small values), apply YOLOv5 decode
-                    if bx < 10 and by < 10:
-                        bx = (bx * 2 - 0.5 + gx) * stride
-                        by = (by * 2 - 0.5 + gy) * stride
-                        bw = (bw * 2) ** 2 * anchor[a][0]
-                        bh = (bh * 2) ** 2 * anchor[a][1]
-                    
-                    # Convert to corner format and scale to original image
-                    x1 = (bx - bw / 2) * scale_x
-                    y1 = (by - bh / 2) * scale_y
-                    x2 = (bx + bw / 2) * scale_x
-                    y2 = (by + bh / 2) * scale_y
-                    
-                    boxes.append([x1, y1, x2, y2])
-                    scores.append(float(confidence))
-                    class_ids.append(int(class_id))
-    
-    return boxes, scores, class_ids
-
-
-def nms(boxes, scores, class_ids, threshold):
-    """Non-maximum suppression"""
-    if len(boxes) == 0:
-        return [], [], []
+        # Reshape to (3, 85, H, W)
+        output = output.reshape(num_anchors, num_outputs, grid_h, grid_w)
+        
+        # Decode straight into the candidate buffers at the write cursor
+        count = _decode_level(output, levels[idx], CONF_THRESHOLD, out, count,
+                              logits, boxes_are_grid_relative(output, logits))
+    
+    boxes = boxes[:count]
     
-    boxes = np.array(boxes)
-    scores = np.array(scores)
-    class_ids = np.array(class_ids)
+    # Undo letterbox: remove padding, scale to original image
+    scale, offset = box_transform(img_w, img_h)
+    boxes *= scale
+    boxes += offset
     
+    return boxes, scores[:count], class_ids[:count]
+
+
+def _nms_numpy(boxes, scores, threshold):
+    """Greedy NMS in NumPy - fallback for OpenCV builds without the dnn module"""
     # Sort by score
     indices = np.argsort(scores)[::-1]
     
@@ -159,12 +383,53 @@ def nms(boxes, scores, class_ids, threshold):
         area_i = (boxes[i, 2] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 1])
         area_rest = (boxes[rest, 2] - boxes[rest, 0]) * (boxes[rest, 3] - boxes[rest, 1])
         
-        iou = inter / (area_i + area_rest - inter + 1e-6)
+        union = area_i + area_rest - inter
         
-        # Keep boxes with low IoU
-        indices = rest[iou < threshold]
+        # Keep boxes with low IoU - compare inter against threshold * union
+        # rather than dividing (same as cv2.dnn.NMSBoxes: suppress if IoU > threshold)
+        indices = rest[inter <= threshold * union]
+    
+    return np.array(keep, dtype=np.intp)
+
+
+def _nms_single(boxes, scores, threshold):
+    """Greedy NMS over one set of boxes, returns kept indices (highest score first)"""
+    if not hasattr(cv2, 'dnn'):
+        return _nms_numpy(boxes, scores, threshold)
+    
+    # OpenCV's C++ NMS expects [x, y, w, h]
+    boxes_xywh = np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+    idx = cv2.dnn.NMSBoxes(boxes_xywh, scores.astype(np.float32), CONF_THRESHOLD, threshold)
+    return np.asarray(idx, dtype=np.intp).reshape(-1)
+
+
+def nms(boxes, scores, class_ids, threshold):
+    """Class-aware non-maximum suppression, returns the kept (boxes, scores, class_ids) arrays"""
+    if len(boxes) == 0:
+        return np.empty((0, 4)), np.empty(0), np.empty(0, dtype=np.int64)
+    
+    boxes = np.asarray(boxes, dtype=np.float64)
+    scores = np.asarray(scores)
+    class_ids = np.asarray(class_ids)
     
-    return boxes[keep].tolist(), scores[keep].tolist(), class_ids[keep].tolist()
+    # Only the top-K scores go into NMS - partial select instead of a full sort
+    if len(scores) > NMS_TOP_K:
+        top = np.argpartition(-scores, NMS_TOP_K - 1)[:NMS_TOP_K]
+        boxes, scores, class_ids = boxes[top], scores[top], class_ids[top]
+    
+    if hasattr(cv2, 'dnn') and hasattr(cv2.dnn, 'NMSBoxesBatched'):
+        # OpenCV 4.7+ does the class-aware pass in one C++ call
+        boxes_xywh = np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+        idx = cv2.dnn.NMSBoxesBatched(boxes_xywh, scores.astype(np.float32),
+                                      class_ids.astype(np.int32), CONF_THRESHOLD, threshold)
+        keep = np.asarray(idx, dtype=np.intp).reshape(-1)
+    else:
+        # Shift each class into its own coordinate range so a single NMS pass
+        # never suppresses across classes
+        span = boxes.max() - boxes.min() + 1
+        keep = _nms_single(boxes + class_ids[:, None] * span, scores, threshold)
+    
+    return boxes[keep], scores[keep], class_ids[keep]
 
 
 class YOLODetector:
@@ -172,6 +437,34 @@ class YOLODetector:
         self.rknn = RKNNLite()
         self.labels = load_labels(LABELS_PATH)
         
+        # Per-level strides/anchors/grids, built once instead of on every frame
+        self._levels = build_levels()
+        
+        # Model inputs (NHWC uint8), one per pipeline slot - the final color
+        # conversion writes straight into the letterbox region, the padding
+        # is only rewritten when the frame geometry changes
+        self._inputs = [np.full((1, INPUT_SIZE, INPUT_SIZE, 3), PAD_VALUE, dtype=np.uint8)
+                        for _ in range(PIPELINE_DEPTH)]
+        self._input_geometry = [None] * PIPELINE_DEPTH
+        
+        # Persistent intermediate buffers, reused every frame via dst=
+        # (only touched by whichever thread preprocesses)
+        self._scratch_bufs = {}
+        
+        # Candidate buffers sized for every cell of every level
+        max_candidates = sum(3 * (INPUT_SIZE // stride) ** 2 for stride in STRIDES)
+        self._candidates = (
+            np.empty((max_candidates, 4), dtype=np.float32),
+            np.empty(max_candidates, dtype=np.float32),
+            np.empty(max_candidates, dtype=np.int64),
+        )
+        
+        # Output records - NMS never keeps more than NMS_TOP_K boxes
+        self._detections = np.empty(NMS_TOP_K, dtype=DETECTION_DTYPE)
+        
+        # Whether the model exports logits - detected once on the first frame
+        self._needs_sigmoid = None
+        
         # Load model
         print(f"Loading model: {MODEL_PATH}", file=sys.stderr)
         ret = self.rknn.load_rknn(MODEL_PATH)
@@ -184,115 +477,283 @@ class YOLODetector:
         if ret != 0:
             raise RuntimeError(f"Failed to init runtime: {ret}")
         
+        # Warm up on a blank frame so NPU buffer setup and decode JIT happen
+        # now rather than on the first real frame
+        print("Warming up...", file=sys.stderr)
+        try:
+            self.infer((self._inputs[0], INPUT_SIZE, INPUT_SIZE))
+        except Exception as e:
+            print(f"Warm-up failed: {e}", file=sys.stderr)
+        
         print("YOLO Detector ready!", file=sys.stderr)
     
-    def detect(self, jpeg_data):
+    def _scratch(self, name, shape):
+        """Persistent scratch buffer, reallocated only if the frame geometry changes"""
+        buf = self._scratch_bufs.get(name)
+        if buf is None or buf.shape != shape:
+            buf = self._scratch_bufs[name] = np.empty(shape, dtype=np.uint8)
+        return buf
+    
+    def _letterbox_region(self, slot, width, height):
         """
-        Detect objects in JPEG image
-        Returns list of detections
+        View of the slot's model input that a width x height frame is resized into
+        Returns (region, new_w, new_h)
         """
-        # Decode JPEG
-        img_array = np.frombuffer(jpeg_data, dtype=np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        img_input = self._inputs[slot]
+        new_w, new_h, pad_x, pad_y = geometry = letterbox_params(width, height)
+        
+        # Padding stays valid between frames of the same size
+        if self._input_geometry[slot] != geometry:
+            img_input.fill(PAD_VALUE)
+            self._input_geometry[slot] = geometry
+        
+        return img_input[0, pad_y:pad_y + new_h, pad_x:pad_x + new_w], new_w, new_h
+    
+    def preprocess(self, frame_data, fmt, width, height, slot=0):
+        """
+        Turn an input frame into the (letterboxed) model input tensor of the given pipeline slot
+        Returns (img_input, orig_w, orig_h), or None if the frame can't be decoded
+        """
+        img_array = np.frombuffer(frame_data, dtype=np.uint8)
+        
+        if fmt == FORMAT_RGB:
+            # Producer already letterboxed and converted - no decode, resize or color pass
+            img_rgb = img_array.reshape(INPUT_SIZE, INPUT_SIZE, 3)
+            return np.expand_dims(img_rgb, axis=0), width, height
+        
+        if fmt == FORMAT_NV12:
+            # Resize the Y and interleaved UV planes separately, then convert
+            # only the letterbox region instead of the full frame
+            region, new_w, new_h = self._letterbox_region(slot, width, height)
+            y_plane = img_array[:width * height].reshape(height, width)
+            uv_plane = img_array[width * height:].reshape(height // 2, width // 2, 2)
+            nv12 = self._scratch('nv12', (new_h * 3 // 2, new_w))
+            cv2.resize(y_plane, (new_w, new_h), dst=nv12[:new_h])
+            cv2.resize(uv_plane, (new_w // 2, new_h // 2),
+                       dst=nv12[new_h:].reshape(new_h // 2, new_w // 2, 2))
+            cv2.cvtColor(nv12, cv2.COLOR_YUV2RGB_NV12, dst=region)
+            return self._inputs[slot], width, height
+        
+        if fmt == FORMAT_GRAY_RESIZED:
+            # Producer already resized - only the GRAY->RGB pass into the letterbox region
+            region, new_w, new_h = self._letterbox_region(slot, width, height)
+            cv2.cvtColor(img_array.reshape(new_h, new_w), cv2.COLOR_GRAY2RGB, dst=region)
+            return self._inputs[slot], width, height
+        
+        if fmt == FORMAT_GRAY:
+            # Raw sensor frame - nothing to decode
+            self._resize_to_input(img_array.reshape(height, width), slot)
+            return self._inputs[slot], width, height
+        
+        # Decode JPEG - grayscale JPEGs stay single channel
+        img = cv2.imdecode(img_array, cv2.IMREAD_ANYCOLOR)
         
         if img is None:
-            return {"error": "Failed to decode image", "detections": []}
+            return None
         
         orig_h, orig_w = img.shape[:2]
         
-        # Handle grayscale images - convert to 3-channel
-        if len(img.shape) == 2:
-            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-        elif img.shape[2] == 1:
-            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-        
-        # Resize to model input size (letterbox)
-        img_resized = cv2.resize(img, (INPUT_SIZE, INPUT_SIZE))
+        self._resize_to_input(img, slot)
+        return self._inputs[slot], orig_w, orig_h
+    
+    def _resize_to_input(self, img, slot):
+        """
+        Letterbox-resize a gray or BGR image at its native channel count, then
+        a single color pass (GRAY->RGB or BGR->RGB) into the slot's input region
+        """
+        height, width = img.shape[:2]
+        region, new_w, new_h = self._letterbox_region(slot, width, height)
         
-        # Convert BGR to RGB
-        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+        if img.ndim == 2:
+            resized = self._scratch('gray', (new_h, new_w))
+            cv2.resize(img, (new_w, new_h), dst=resized)
+            cv2.cvtColor(resized, cv2.COLOR_GRAY2RGB, dst=region)
+        else:
+            resized = self._scratch('bgr', (new_h, new_w, 3))
+            cv2.resize(img, (new_w, new_h), dst=resized)
+            cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=region)
+    
+    def detect(self, frame_data, fmt=FORMAT_JPEG, width=0, height=0):
+        """
+        Detect objects in a frame (JPEG by default, see FORMAT_*)
+        Returns (width, height, detections), see infer()
+        """
+        return self.infer(self.preprocess(frame_data, fmt, width, height))
+    
+    def infer(self, frame):
+        """
+        Run inference + post-processing on a preprocessed frame
+        Returns (width, height, detections) where detections is a DETECTION_DTYPE
+        array - a view of a buffer reused on the next call
+        """
+        if frame is None:
+            raise ValueError("Failed to decode image")
         
-        # Add batch dimension (model expects 4D: [batch, height, width, channels])
-        img_input = np.expand_dims(img_rgb, axis=0)
+        img_input, orig_w, orig_h = frame
         
         # Run inference
         outputs = self.rknn.inference(inputs=[img_input])
         
         # Debug: print output shapes
-        print(f"Inference outputs: {len(outputs)} tensors", file=sys.stderr)
-        for i, out in enumerate(outputs):
-            out_arr = np.array(out)
-            print(f"  Output {i}: shape={out_arr.shape}, min={out_arr.min():.2f}, max={out_arr.max():.2f}", file=sys.stderr)
+        if DEBUG:
+            print(f"Inference outputs: {len(outputs)} tensors", file=sys.stderr)
+            for i, out in enumerate(outputs):
+                out_arr = np.asarray(out)
+                print(f"  Output {i}: shape={out_arr.shape}, min={out_arr.min():.2f}, max={out_arr.max():.2f}", file=sys.stderr)
+        
+        if self._needs_sigmoid is None:
+            self._needs_sigmoid = outputs_are_logits(outputs)
+            print(f"Model outputs {'logits' if self._needs_sigmoid else 'probabilities'}", file=sys.stderr)
         
         # Process outputs
         try:
-            boxes, scores, class_ids = process_yolo_output(outputs, orig_w, orig_h)
-            print(f"Post-process: {len(boxes)} raw detections", file=sys.stderr)
+            boxes, scores, class_ids = process_yolo_output(
+                outputs, orig_w, orig_h, self._levels, self._candidates, self._needs_sigmoid)
+            if DEBUG:
+                print(f"Post-process: {len(boxes)} raw detections", file=sys.stderr)
         except Exception as e:
             print(f"Post-process ERROR: {e}", file=sys.stderr)
-            return {"error": str(e), "detections": []}
+            raise
         
         # Apply NMS
         boxes, scores, class_ids = nms(boxes, scores, class_ids, NMS_THRESHOLD)
         
-        # Format detections
-        detections = []
-        for box, score, class_id in zip(boxes, scores, class_ids):
-            detections.append({
-                "class": self.labels[class_id] if class_id < len(self.labels) else f"class_{class_id}",
-                "confidence": round(score, 3),
-                "bbox": {
-                    "x1": int(max(0, box[0])),
-                    "y1": int(max(0, box[1])),
-                    "x2": int(min(orig_w, box[2])),
-                    "y2": int(min(orig_h, box[3]))
-                }
-            })
-        
-        return {
-            "width": orig_w,
-            "height": orig_h,
-            "detections": detections
-        }
+        # Fill the wire records column by column (boxes truncate to int16)
+        boxes = np.clip(boxes, 0, [orig_w, orig_h, orig_w, orig_h])
+        detections = self._detections[:len(scores)]
+        detections['c'] = class_ids
+        detections['s'] = scores
+        for i, name in enumerate(('x1', 'y1', 'x2', 'y2')):
+            detections[name] = boxes[:, i]
+        
+        return orig_w, orig_h, detections
     
     def __del__(self):
         if hasattr(self, 'rknn'):
             self.rknn.release()
 
 
-def main():
+def write_labels(labels):
+    """Send the class labels once after READY: u32 length + newline-joined UTF-8"""
+    data = "\n".join(labels).encode()
+    sys.stdout.buffer.write(struct.pack('<I', len(data)) + data)
+    sys.stdout.buffer.flush()
+
+
+def write_result(width, height, detections):
+    """Write one detection result to stdout: RESULT_HEADER + DETECTION_DTYPE records"""
+    sys.stdout.buffer.write(RESULT_HEADER.pack(width, height, len(detections)) + detections.tobytes())
+    sys.stdout.buffer.flush()
+
+
+def write_error(message):
+    """Write an error result: zero-size RESULT_HEADER + UTF-8 message"""
+    data = message.encode()
+    sys.stdout.buffer.write(RESULT_HEADER.pack(0, 0, len(data)) + data)
+    sys.stdout.buffer.flush()
+
+
+def read_exact(stream, view):
     """
-    Main loop - reads JPEG frames from stdin, outputs JSON detections
-    Protocol:
-    - Input: 4-byte length (little-endian) + JPEG data
-    - Output: JSON line (newline terminated)
+    Fill a memoryview from a binary stream, looping over short reads
+    Returns False on EOF
     """
-    detector = YOLODetector()
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            return False
+        filled += n
+    return True
+
+
+def frame_reader(detector, stdin, ready, free):
+    """
+    Pipeline worker - reads and preprocesses frames into free slots so the
+    next frame is ready as soon as the NPU finishes the current one
+    Puts (slot, frame) on ready, where frame is the preprocess result or the
+    exception raised; None marks end of input
+    """
+    header = memoryview(bytearray(FRAME_HEADER.size))
     
-    print("READY", flush=True)  # Signal ready to parent process
+    # Per-slot receive buffers - FORMAT_RGB frames are fed to the NPU in place
+    frame_bufs = [memoryview(bytearray(FRAME_BUFFER_SIZE)) for _ in range(PIPELINE_DEPTH)]
     
     while True:
+        slot = free.get()
         try:
-            # Read length prefix
-            length_bytes = sys.stdin.buffer.read(4)
-            if len(length_bytes) < 4:
+            # Read frame header
+            if not read_exact(stdin, header):
                 break
             
-            length = struct.unpack('<I', length_bytes)[0]
+            length, fmt, width, height = FRAME_HEADER.unpack(header)
             
-            # Read JPEG data
-            jpeg_data = sys.stdin.buffer.read(length)
-            if len(jpeg_data) < length:
-                break
+            # Grow the buffer if a frame ever exceeds it
+            if length > len(frame_bufs[slot]):
+                frame_bufs[slot] = memoryview(bytearray(length))
             
-            # Detect
-            result = detector.detect(jpeg_data)
+            # Read frame data
+            frame_data = frame_bufs[slot][:length]
+            if not read_exact(stdin, frame_data):
+                break
             
-            # Output JSON
-            print(json.dumps(result), flush=True)
+            ready.put((slot, detector.preprocess(frame_data, fmt, width, height, slot)))
+        
+        except Exception as e:
+            ready.put((slot, e))
+    
+    ready.put(None)
+
+
+def main():
+    """
+    Main loop - reads frames from stdin, outputs binary detections
+    Protocol:
+    - Startup: "READY" line, then the labels (see write_labels)
+    - Input: 9-byte header (little-endian u32 length, u8 format, u16 width, u16 height)
+      + frame data (see FORMAT_*)
+    - Output: RESULT_HEADER + count DETECTION_DTYPE records (14 bytes each),
+      one per frame, in order (see write_result / write_error)
+    
+    Reading/preprocessing runs on a worker thread, inference and
+    post-processing on this one (both release the GIL in C code)
+    """
+    detector = YOLODetector()
+    
+    print("READY", flush=True)  # Signal ready to parent process
+    write_labels(detector.labels)
+    
+    ready = queue.Queue()
+    free = queue.Queue()
+    for slot in range(PIPELINE_DEPTH):
+        free.put(slot)
+    
+    reader = threading.Thread(target=frame_reader, args=(detector, sys.stdin.buffer, ready, free), daemon=True)
+    reader.start()
+    
+    while True:
+        item = ready.get()
+        if item is None:
+            break
+        
+        slot, frame = item
+        try:
+            if isinstance(frame, Exception):
+                raise frame
             
+            # Detect
+            result = detector.infer(frame)
         except Exception as e:
-            print(json.dumps({"error": str(e), "detections": []}), flush=True)
+            result = str(e)
+        finally:
+            # Hand the slot back to the reader
+            free.put(slot)
+        
+        # Output records
+        if isinstance(result, str):
+            write_error(result)
+        else:
+            write_result(*result)
 
 
 if __name__ == "__main__":